@@ -1,13 +1,24 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from openai import OpenAI
 from elevenlabs import ElevenLabs
-from moviepy.editor import concatenate_videoclips, ImageClip, AudioFileClip
 from PIL import Image, ImageDraw, ImageFont
 import requests
 import os
 import textwrap
-import PyPDF2
-from docx import Document
+from documents import extract_text
+from image_backends import IMAGE_BACKEND_CHOICES, get_image_backend
+from script_planner import build_image_prompt, cached_plan, fallback_plan, plan_script
+from asset_store import get_asset_store
+from audio_post import AUDIO_POST_DEFAULTS
+from assets import (
+    audio_asset, audio_asset_path, captioned_image_asset, image_asset, image_asset_path, set_asset_store,
+)
+from artifact_server import artifact_serving_enabled, artifact_url, player_url
+from journal import RenderJournal, render_job_id
+from media_probe import save_narration
+from planner import AdmissionController, StageTimings, describe_estimate, estimate_render
+from render import ProgressiveRender, load_manifest, save_manifest
 
 # Styling for Streamlit app
 st.markdown("""
@@ -22,6 +33,25 @@ os.environ["OPENAI_API_KEY"] = st.secrets["openai_api_key"]
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 elevenlabs_client = ElevenLabs(api_key=st.secrets["elevenlabs_api_key"])
 
+# Optional shared asset store, so generated assets are reused across app instances
+@st.cache_resource
+def load_asset_store():
+    return get_asset_store(st.secrets.get("asset_store"))
+
+set_asset_store(load_asset_store())
+
+# Per-stage timings and render admission are shared by every session in the process
+@st.cache_resource
+def load_stage_timings():
+    return StageTimings()
+
+@st.cache_resource
+def load_admission_controller():
+    return AdmissionController(**st.secrets.get("admission", {}))
+
+stage_timings = load_stage_timings()
+admission = load_admission_controller()
+
 # Helper functions
 def compress_image(image_path, output_path, quality=50):
     with Image.open(image_path) as img:
@@ -35,11 +65,15 @@ def add_text_overlay(image_path, text, output_path, font_path):
         img = Image.open(image_path).convert("RGBA")
         draw = ImageDraw.Draw(img)
 
+        # Layout is designed for 1024px frames; scale it so 512px preview drafts caption the same way
+        scale = img.width / 1024
+        pad = round(20 * scale)
+
         # Load font
-        font = ImageFont.truetype(font_path, size=30)
+        font = ImageFont.truetype(font_path, size=round(30 * scale))
 
         # Calculate text wrapping
-        max_text_width = img.width - 40  # Leave 20px padding on each side
+        max_text_width = img.width - 2 * pad  # Leave padding on each side
         wrapped_text = textwrap.fill(text, width=40)
 
         # Measure text dimensions
@@ -48,14 +82,14 @@ def add_text_overlay(image_path, text, output_path, font_path):
         text_height = text_bbox[3] - text_bbox[1]
 
         # Calculate positions
-        x_start = 20  # Padding
-        y_start = img.height - text_height - 40  # Place at bottom with padding
+        x_start = pad  # Padding
+        y_start = img.height - text_height - 2 * pad  # Place at bottom with padding
 
         # Create semi-transparent rectangle for background
         background = Image.new("RGBA", img.size, (255, 255, 255, 0))
         background_draw = ImageDraw.Draw(background)
         background_draw.rectangle(
-            [(x_start - 10, y_start - 10), (x_start + text_width + 20, y_start + text_height + 10)],
+            [(x_start - pad // 2, y_start - pad // 2), (x_start + text_width + pad, y_start + text_height + pad // 2)],
             fill=(0, 0, 0, 128)  # Semi-transparent black
         )
 
@@ -79,16 +113,98 @@ def download_font(font_url, local_path):
         with open(local_path, "wb") as f:
             f.write(response.content)
 
-def extract_text_from_document(file):
-    if file.name.endswith(".pdf"):
-        reader = PyPDF2.PdfReader(file)
-        text = "".join(page.extract_text() for page in reader.pages)
-    elif file.name.endswith(".docx"):
-        doc = Document(file)
-        text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
-    elif file.name.endswith(".txt"):
-        text = file.read().decode("utf-8")
+def generate_captioned_image(image_backend, image_prompt, style, sentence, journal, idx):
+    """
+    Generate, compress and caption the image for one sentence, journaling each stage.
+    Returns (captioned_path, draft); draft is True when a local draft stood in for the image service.
+    """
+    image_filename = journal.run_stage(idx, "image", lambda: image_asset(
+        image_backend, image_prompt, style,
+        postprocess=lambda path: compress_image(path, path, quality=50)
+    ), key=image_prompt)
+    captioned_path = journal.run_stage(idx, "captioned", lambda: captioned_image_asset(
+        image_filename, sentence,
+        lambda image_path, text, output_path: add_text_overlay(image_path, text, output_path, local_font_path)
+    ), key=[image_filename, sentence])
+    return captioned_path, getattr(image_filename, "draft", False)
+
+def synthesize_speech(text, output_path):
+    """
+    Narrate one sentence with ElevenLabs.
+    """
+    audio = elevenlabs_client.text_to_speech.convert(
+        voice_id=VOICE_ID,
+        model_id="eleven_multilingual_v2",
+        text=text,
+        voice_settings={"stability": 0.2, "similarity_boost": 0.8},
+        output_format=NARRATION_FORMAT
+    )
+    save_narration(audio, output_path, NARRATION_FORMAT)
+
+def frame_image_prompt(plan, segment, style):
+    return build_image_prompt(plan, segment, style) + " with no letters, no words, and no text at all in the images. "
+
+def cached_work(plan, image_backend, style):
+    """Images and narration from earlier renders that this plan will reuse, for the estimate."""
+    texts = [segment["text"] for segment in plan["segments"]]
+    prompts = [frame_image_prompt(plan, segment, style) for segment in plan["segments"]]
+    return {
+        "cached_images": sum(os.path.exists(image_asset_path(image_backend, prompt, style)) for prompt in prompts),
+        "cached_texts": {text for text in texts if os.path.exists(audio_asset_path(text, VOICE_ID, NARRATION_FORMAT))},
+    }
+
+def promotion_work(manifest, image_backend):
+    """Promotion reuses all narration and only regenerates draft images."""
+    return {
+        "cached_images": sum(
+            not segment.get("draft_image")
+            or os.path.exists(image_asset_path(image_backend, segment["image_prompt"], manifest["style"]))
+            for segment in manifest["segments"]
+        ),
+        "cached_texts": {segment["text"] for segment in manifest["segments"]},
+    }
+
+def start_progressive_render(profile_name, audio_settings, journal):
+    """
+    Encode segments as they are generated, with a player that starts on the first finished clip.
+    """
+    renderer = ProgressiveRender(profile_name, journal.job_path("hls"), audio_settings, journal)
+    if not artifact_serving_enabled():
+        return renderer
+    st.caption("▶️ Playback starts as soon as the first clips are encoded; the rest are appended as they finish.")
+    try:
+        components.iframe(player_url(renderer.playlist.directory), height=520)
+    except Exception as e:
+        # The render itself does not depend on the player
+        st.warning(f"⚠️ Live playback is unavailable: {e}")
+    return renderer
+
+def render_outputs(renderer):
+    """
+    Finish the progressive render; the combined narration is written alongside.
+    """
+    st.write("⏳ Combining video clips and audio...")
+    video_path, combined_audio_path = renderer.finish(
+        renderer.journal.job_path(FINAL_VIDEO_NAME), narration_path=renderer.journal.job_path(COMBINED_AUDIO_NAME)
+    )
+
+    st.session_state.video_path = video_path
+    st.session_state.audio_path = combined_audio_path
+    if artifact_serving_enabled():
+        # Outputs are streamed from disk by the artifact server; only their URLs live in the session
+        st.session_state.video_url = artifact_url(video_path)
+        st.session_state.audio_url = artifact_url(combined_audio_path, "final_audio.wav")
     else:
+        st.session_state.video_url = st.session_state.audio_url = None
+    st.write("🎉 Video generation complete!")
+
+def extract_text_from_document(file, page_range=None, max_chars=None):
+    try:
+        text = extract_text(file, page_range=page_range, max_chars=max_chars)
+    except UnicodeDecodeError:
+        st.error("The text file is not UTF-8 encoded. Please save it as UTF-8 and upload it again.")
+        text = ""
+    except ValueError:
         st.error("Unsupported file type.")
         text = ""
     return text
@@ -98,6 +214,14 @@ font_url = "https://github.com/scooter7/vidshorts/blob/main/Arial.ttf"
 local_font_path = "Arial.ttf"
 download_font(font_url, local_font_path)  # Use local_font_path instead of local_path
 
+# Narration voice and render outputs (written inside each job's directory, so sessions never share them)
+VOICE_ID = "NYy9s57OPECPcDJavL3T"
+# Set elevenlabs_output_format to a pcm_* format (e.g. pcm_22050) where the plan supports it
+NARRATION_FORMAT = st.secrets.get("elevenlabs_output_format", "mp3_44100_128")
+FINAL_VIDEO_NAME = "final_video.mp4"
+COMBINED_AUDIO_NAME = "combined_audio.wav"
+SUMMARY_CHARS = 4000
+
 # Placeholder image setup
 placeholder_url = "https://raw.githubusercontent.com/scooter7/vidshorts/main/placeholder.jpg"
 placeholder_path = "placeholder.jpg"
@@ -117,14 +241,22 @@ st.write("Generate videos with captions and select your desired image style.")
 uploaded_file = st.file_uploader("Upload a document (PDF, Word, or text file):", type=["pdf", "docx", "txt"])
 
 if uploaded_file:
+    page_range = None
+    if uploaded_file.name.endswith(".pdf"):
+        first_page, last_page = st.columns(2)
+        page_range = (
+            first_page.number_input("First page", min_value=1, value=1, step=1),
+            last_page.number_input("Last page", min_value=1, value=9999, step=1),
+        )
     try:
-        full_text = extract_text_from_document(uploaded_file)
+        # Only the first SUMMARY_CHARS characters are summarized, so stop extracting there
+        full_text = extract_text_from_document(uploaded_file, page_range=page_range, max_chars=SUMMARY_CHARS)
         if full_text:
             st.write("📖 Summarizing the document...")
             summary_response = client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
-                    {"role": "user", "content": f"Summarize the following text:\n\n{full_text[:4000]}"},
+                    {"role": "user", "content": f"Summarize the following text:\n\n{full_text}"},
                 ]
             )
             summarized_topic = summary_response.choices[0].message.content.strip()
@@ -139,6 +271,7 @@ if "summarized_topic" in st.session_state and st.session_state.summarized_topic:
         "Choose an image style for the video:",
         ["Realistic", "Oil Painting", "Watercolor", "Sketch", "Fantasy Art", "3D Render"]
     )
+    backend_choice = st.selectbox("Image generator:", IMAGE_BACKEND_CHOICES)
 
     if st.button("Generate Script"):
         try:
@@ -160,87 +293,170 @@ if "summarized_topic" in st.session_state and st.session_state.summarized_topic:
 if "script" in st.session_state and st.session_state.script:
     st.text_area("Generated Script", st.session_state.script, height=200)
 
+    preview_mode = st.checkbox("Preview mode (low resolution, fast render)", value=False)
+    crossfade_ms = st.slider("Crossfade between sentences (ms):", 0, 300, AUDIO_POST_DEFAULTS["crossfade_ms"], step=10)
+
+    # Predict the work before committing to it; assets reused from earlier renders are free
+    estimate_backend = get_image_backend(backend_choice, client, placeholder_path, preview=preview_mode)
+    estimate_plan = cached_plan(st.session_state.script, style_choice) or fallback_plan(st.session_state.script)
+    estimate = estimate_render(
+        [segment["text"] for segment in estimate_plan["segments"]], estimate_backend, stage_timings,
+        **cached_work(estimate_plan, estimate_backend, style_choice)
+    )
+    st.caption(f"📊 Estimate: {describe_estimate(estimate)}")
+
     if st.button("Generate Video"):
         try:
             st.write("🎥 Starting video generation...")
-            sentences = st.session_state.script.split(". ")
-            video_clips = []
-            audio_files = []
-            os.makedirs("images", exist_ok=True)
-            os.makedirs("audio", exist_ok=True)
-
-            for idx, sentence in enumerate(sentences):
-                st.write(f"🔄 Processing frame {idx + 1}/{len(sentences)}...")
-                try:
-                    # Generate image
-                    image_prompt = f"{sentence} in {style_choice.lower()} style with no letters, no words, and no text at all in the images. "
-                    response = client.images.generate(
-                        model="dall-e-3",
-                        prompt=image_prompt,
-                        size="1024x1024",
-                        quality="standard",
-                        n=1
+            st.write("🧭 Planning scenes and image prompts...")
+            try:
+                plan = plan_script(client, st.session_state.script, style_choice)
+            except Exception as e:
+                st.warning(f"Scene planning failed, using one image per sentence: {e}")
+                plan = fallback_plan(st.session_state.script)
+            segments = []
+            missing = []
+            image_backend = get_image_backend(backend_choice, client, placeholder_path, preview=preview_mode)
+
+            # Wait for a render slot; when the image quota is saturated the render is downscaled
+            texts = [plan_segment["text"] for plan_segment in plan["segments"]]
+            with admission.admit(
+                texts, image_backend, stage_timings, **cached_work(plan, image_backend, style_choice),
+                on_queued=lambda active: st.info(f"⏸️ Waiting for one of {active} running renders to finish...")
+            ) as estimate:
+                image_stride = estimate["image_stride"]
+                if image_stride > 1:
+                    st.info(f"The image provider is busy, so each image is shared by {image_stride} frames.")
+
+                # Resubmitting the same job resumes from its journal, redoing only missing or failed stages
+                journal = RenderJournal(render_job_id(
+                    st.session_state.script, style_choice, backend_choice, preview_mode, VOICE_ID, NARRATION_FORMAT
+                ), timings=stage_timings)
+                profile_name = "preview" if preview_mode else "full"
+                renderer = start_progressive_render(profile_name, {"crossfade_ms": crossfade_ms}, journal)
+
+                for idx, plan_segment in enumerate(plan["segments"]):
+                    sentence = plan_segment["text"]
+                    st.write(f"🔄 Processing frame {idx + 1}/{len(plan['segments'])}...")
+                    try:
+                        # Generate captioned image; with an image stride, consecutive frames share one image
+                        leader_segment = plan["segments"][idx - idx % image_stride]
+                        image_prompt = frame_image_prompt(plan, leader_segment, style_choice)
+                        captioned_image_path, draft = generate_captioned_image(
+                            image_backend, image_prompt, style_choice, sentence, journal, idx
+                        )
+                        if draft:
+                            st.warning(
+                                f"⚠️ The image service was busy, so frame {idx + 1} uses a local draft image. "
+                                "Render Full Quality to replace it."
+                            )
+
+                        # Generate audio, shared with any identical sentence already narrated
+                        audio_filename = journal.run_stage(
+                            idx, "audio", lambda: audio_asset(sentence, VOICE_ID, synthesize_speech, NARRATION_FORMAT),
+                            key=sentence
+                        )
+
+                        segments.append({
+                            "index": idx,
+                            "text": sentence,
+                            "image_prompt": image_prompt,
+                            "captioned_image": captioned_image_path,
+                            "audio": audio_filename,
+                            "draft_image": preview_mode or draft,
+                        })
+                        if not missing:
+                            # Encoded in the background while the next frame is generated
+                            renderer.add(segments[-1])
+
+                    except Exception as e:
+                        st.error(f"Failed to process frame {idx + 1}: {e}")
+                        missing.append(idx)
+                        continue
+
+                if missing:
+                    renderer.cancel()
+                    st.error(
+                        f"⚠️ Frames {', '.join(str(idx + 1) for idx in missing)} could not be generated. "
+                        "Click Generate Video again to retry just those; completed work is kept."
                     )
-                    image_url = response.data[0].url
-                    image_filename = f"images/image_{idx}.jpg"
-                    image_data = requests.get(image_url).content
-                    with open(image_filename, "wb") as f:
-                        f.write(image_data)
-                    compress_image(image_filename, image_filename, quality=50)
-
-                    # Add text overlay
-                    captioned_image_path = f"images/captioned_image_{idx}.jpg"
-                    add_text_overlay(image_filename, sentence, captioned_image_path, local_font_path)
-
-                    # Generate audio
-                    audio = elevenlabs_client.text_to_speech.convert(
-                        voice_id="NYy9s57OPECPcDJavL3T",
-                        model_id="eleven_multilingual_v2",
-                        text=sentence,
-                        voice_settings={"stability": 0.2, "similarity_boost": 0.8}
-                    )
-                    audio_filename = f"audio/audio_{idx}.mp3"
-                    with open(audio_filename, "wb") as f:
-                        for chunk in audio:
-                            f.write(chunk)
-                    audio_clip = AudioFileClip(audio_filename)
-
-                    # Create video clip with captioned image and audio
-                    image_clip = ImageClip(captioned_image_path, duration=audio_clip.duration).set_audio(audio_clip)
-                    video_clips.append(image_clip.set_fps(30))
-
-                except Exception as e:
-                    st.error(f"Failed to process frame {idx}: {e}")
-                    continue
-
-            # Combine video clips
-            st.write("⏳ Combining video clips...")
-            final_video = concatenate_videoclips(video_clips, method="compose")
-            final_video_path = "final_video.mp4"
-            final_video.write_videofile(final_video_path, codec="libx264", audio_codec="aac", fps=24)
-
-            # Combine audio files
-            st.write("🎵 Combining audio...")
-            combined_audio_path = "combined_audio.mp3"
-            audio_files_str = "|".join(audio_files)
-            os.system(f"ffmpeg -y -i 'concat:{audio_files_str}' -acodec copy {combined_audio_path}")
-
-            st.write("🎉 Video generation complete!")
-            st.video(final_video_path)
+                else:
+                    manifest = {
+                        "job_id": journal.job_id,
+                        "style": style_choice,
+                        "backend": backend_choice,
+                        "audio_settings": {"crossfade_ms": crossfade_ms},
+                        "segments": segments,
+                    }
+                    st.session_state.manifest_path = save_manifest(manifest, journal.job_path("manifest.json"))
+                    st.session_state.manifest_profile = profile_name
+                    st.session_state.has_draft_images = any(segment["draft_image"] for segment in segments)
+                    render_outputs(renderer)
+        except Exception as e:
+            st.error(f"Failed to generate the video: {e}")
+
+    # Promote an approved preview (or a render with draft frames) to full quality, reusing its narration
+    if st.session_state.get("has_draft_images") and st.button("Render Full Quality"):
+        try:
+            manifest = load_manifest(st.session_state.manifest_path)
+            image_backend = get_image_backend(manifest["backend"], client, placeholder_path)
+            journal = RenderJournal(f"{manifest['job_id']}-full", timings=stage_timings)
+            with admission.admit(
+                [segment["text"] for segment in manifest["segments"]], image_backend, stage_timings,
+                **promotion_work(manifest, image_backend),
+                on_queued=lambda active: st.info(f"⏸️ Waiting for one of {active} running renders to finish...")
+            ):
+                renderer = start_progressive_render("full", manifest.get("audio_settings"), journal)
+                try:
+                    for segment in manifest["segments"]:
+                        if not segment.get("draft_image"):
+                            renderer.add(segment)
+                            continue
+                        idx = segment["index"]
+                        st.write(f"🔄 Upgrading frame {idx + 1}/{len(manifest['segments'])}...")
+                        try:
+                            segment["captioned_image"], segment["draft_image"] = generate_captioned_image(
+                                image_backend, segment["image_prompt"], manifest["style"], segment["text"], journal, idx
+                            )
+                            if segment["draft_image"]:
+                                st.warning(f"⚠️ The image service was busy, so frame {idx + 1} still uses a draft image.")
+                        except Exception as e:
+                            st.error(f"Failed to upgrade frame {idx + 1}, keeping the preview image: {e}")
+                        renderer.add(segment)
+                except Exception:
+                    # Stop the player waiting on segments that will never come
+                    renderer.cancel()
+                    raise
+                st.session_state.manifest_path = save_manifest(manifest, journal.job_path("manifest.json"))
+                st.session_state.manifest_profile = "full"
+                st.session_state.has_draft_images = any(segment["draft_image"] for segment in manifest["segments"])
+                render_outputs(renderer)
+        except Exception as e:
+            st.error(f"Failed to generate the video: {e}")
+
+    if st.session_state.get("video_path"):
+        if st.session_state.get("manifest_profile") == "preview":
+            st.info("This is a low resolution preview. Render full quality once you are happy with it.")
+        elif st.session_state.get("has_draft_images"):
+            st.info("Some frames use draft images because the image service was busy. Render full quality to replace them.")
+        if st.session_state.video_url:
+            st.video(st.session_state.video_url)
 
             # Download video
-            with open(final_video_path, "rb") as video_file:
+            st.link_button("Download Video", f"{st.session_state.video_url}?download=1")
+
+            # Download audio
+            st.link_button("Download Audio", f"{st.session_state.audio_url}?download=1")
+        else:
+            st.video(st.session_state.video_path)
+
+            # Download video
+            with open(st.session_state.video_path, "rb") as video_file:
                 st.download_button("Download Video", video_file, file_name="final_video.mp4", mime="video/mp4")
 
             # Download audio
-            with open(combined_audio_path, "rb") as audio_file:
-                st.download_button("Download Audio", audio_file, file_name="final_audio.mp3", mime="audio/mpeg")
-
-            # Download script
-            script_path = "script.txt"
-            with open(script_path, "w") as script_file:
-                script_file.write(st.session_state.script)
-            with open(script_path, "rb") as text_file:
-                st.download_button("Download Script", text_file, file_name="script.txt", mime="text/plain")
-        except Exception as e:
-            st.error(f"Failed to generate the video: {e}")
+            with open(st.session_state.audio_path, "rb") as audio_file:
+                st.download_button("Download Audio", audio_file, file_name="final_audio.wav", mime="audio/wav")
+
+        # Download script
+        st.download_button("Download Script", st.session_state.script, file_name="script.txt", mime="text/plain")
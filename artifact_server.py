@@ -0,0 +1,239 @@
+"""
+Small local HTTP endpoint that streams rendered files straight from disk.
+
+Streamlit's download button and st.video copy whole files into memory for every
+session. Instead, finished artifacts are registered here and served with HTTP
+Range support using sendfile, so sessions only keep a URL in their state.
+
+A registered directory serves the files inside it, and its bare URL is a small
+HLS player for the directory's index.m3u8, so videos can be watched while their
+later segments are still being encoded.
+
+The server is only used when ARTIFACT_BASE_URL says where browsers reach it
+(e.g. "http://localhost:8502" locally, or the proxy in front of a deployment);
+without it the apps keep serving outputs through Streamlit. It listens on
+loopback unless ARTIFACT_HOST says otherwise. "{port}" in the base URL is
+replaced with the bound port, for hosts running several app processes; with
+it, a busy ARTIFACT_PORT falls back to a free port.
+"""
+import errno
+import mimetypes
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+ARTIFACT_HOST = os.getenv("ARTIFACT_HOST", "127.0.0.1")
+ARTIFACT_PORT = int(os.getenv("ARTIFACT_PORT", "8502"))
+ARTIFACT_BASE_URL = os.getenv("ARTIFACT_BASE_URL")
+# Registered URLs stop working after this long
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 3600)))
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+_NAME_RE = re.compile(r"[\w-][\w.-]*$")
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+# Safari plays HLS natively; other browsers go through hls.js (Media Source Extensions)
+PLAYER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><style>body{margin:0;background:#000}video{width:100%;max-height:100vh}</style></head>
+<body><video id="video" controls autoplay muted playsinline></video>
+<script src="https://cdn.jsdelivr.net/npm/hls.js@1"></script>
+<script>
+var video = document.getElementById("video");
+if (video.canPlayType("application/vnd.apple.mpegurl")) {
+  video.src = "index.m3u8";
+} else if (window.Hls && Hls.isSupported()) {
+  var hls = new Hls();
+  hls.loadSource("index.m3u8");
+  hls.attachMedia(video);
+}
+</script></body></html>
+"""
+
+
+class ArtifactRegistry:
+    """Maps unguessable tokens to files on disk; tokens expire after `ttl` seconds."""
+
+    def __init__(self, ttl=ARTIFACT_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._artifacts = {}
+
+    def register(self, path, filename=None):
+        token = secrets.token_urlsafe(16)
+        filename = filename or os.path.basename(path)
+        now = time.monotonic()
+        with self._lock:
+            # Tokens are registered in time order, so expired ones are at the front
+            for old_token, (_, _, expires) in list(self._artifacts.items()):
+                if expires > now:
+                    break
+                del self._artifacts[old_token]
+            self._artifacts[token] = (os.path.abspath(path), filename, now + self.ttl)
+        return token, filename
+
+    def lookup(self, token):
+        with self._lock:
+            artifact = self._artifacts.get(token)
+        if artifact is None or artifact[2] <= time.monotonic():
+            return None
+        return artifact[:2]
+
+
+def _parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, or None if unsatisfiable."""
+    match = _RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start == "":
+        if end == "":
+            return None
+        # Suffix range: the last N bytes
+        start = max(size - int(end), 0)
+        end = size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+class ArtifactHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        artifact = self.registry.lookup(parts[1]) if len(parts) >= 2 and parts[0] == "artifacts" else None
+        if artifact is not None and os.path.isdir(artifact[0]):
+            if len(parts) == 2 or parts[2] == "":
+                if not url.path.endswith("/"):
+                    # The player loads index.m3u8 relative to its own URL
+                    self.send_response(301)
+                    self.send_header("Location", f"{url.path}/")
+                    self.end_headers()
+                    return
+                self._send_player(send_body)
+                return
+            name = parts[2] if len(parts) == 3 and _NAME_RE.match(parts[2]) else None
+            artifact = (os.path.join(artifact[0], name), name) if name else None
+        if artifact is None or not os.path.isfile(artifact[0]):
+            self.send_error(404)
+            return
+        path, filename = artifact
+
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+            if self.headers.get("Range"):
+                byte_range = _parse_range(self.headers["Range"], size)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start, end = byte_range
+                status = 206
+
+            length = end - start + 1 if size else 0
+            self.send_response(status)
+            self.send_header("Content-Type", mimetypes.guess_type(filename)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if filename.endswith(".m3u8"):
+                # Growing playlists must be re-fetched, never cached
+                self.send_header("Cache-Control", "no-cache")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            if "download" in parse_qs(url.query):
+                self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+            self.end_headers()
+
+            if send_body and length:
+                # socket.sendfile uses os.sendfile, so the file never passes through Python buffers
+                self.wfile.flush()
+                try:
+                    self.connection.sendfile(f, offset=start, count=length)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Players routinely drop connections when seeking
+                    pass
+
+    def _send_player(self, send_body):
+        body = PLAYER_HTML.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_base_url = None
+_server_lock = threading.Lock()
+
+
+def artifact_serving_enabled():
+    """Whether artifact URLs can be handed out; without a base URL they would not reach remote browsers."""
+    return bool(ARTIFACT_BASE_URL)
+
+
+def _bind(handler):
+    try:
+        return ThreadingHTTPServer((ARTIFACT_HOST, ARTIFACT_PORT), handler)
+    except OSError as e:
+        # Another app process on this host already owns the port; a proxied
+        # deployment must say where this process is reachable via "{port}"
+        if e.errno != errno.EADDRINUSE or "{port}" not in ARTIFACT_BASE_URL:
+            raise
+        return ThreadingHTTPServer((ARTIFACT_HOST, 0), handler)
+
+
+def get_artifact_server():
+    """Start the artifact server once per process and return its registry."""
+    global _server, _base_url
+    with _server_lock:
+        if _server is None:
+            if not artifact_serving_enabled():
+                raise RuntimeError("Set ARTIFACT_BASE_URL to the address browsers reach the artifact server at.")
+            handler = type("BoundArtifactHandler", (ArtifactHandler,), {"registry": ArtifactRegistry()})
+            server = _bind(handler)
+            port = server.server_address[1]
+            _base_url = ARTIFACT_BASE_URL.replace("{port}", str(port)).rstrip("/")
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _server = server
+        return _server.RequestHandlerClass.registry
+
+
+def artifact_url(path, filename=None):
+    """
+    Register `path` and return the URL it is served from.
+    Append `?download=1` to the URL to serve it as an attachment.
+    """
+    token, filename = get_artifact_server().register(path, filename)
+    return f"{_base_url}/artifacts/{token}/{quote(filename)}"
+
+
+def player_url(directory):
+    """Register an HLS directory and return the URL of a player for its index.m3u8."""
+    token, _ = get_artifact_server().register(directory)
+    return f"{_base_url}/artifacts/{token}/"
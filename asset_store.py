@@ -0,0 +1,110 @@
+"""
+Shared asset stores, so generated assets are produced once per fleet rather than per node.
+
+Assets are addressed by the same content-hash keys as the local images/, audio/
+and segments/ directories, which act as each node's read-through cache tier.
+The S3 store works with AWS or any S3-compatible server (e.g. a local MinIO) via
+`endpoint_url`; boto3 is only needed when it is configured.
+"""
+import os
+import shutil
+
+MB = 1024 * 1024
+
+
+class AssetStore:
+    """Base class: a flat key -> file store."""
+
+    def download(self, key, dest_path):
+        """Copy the asset to `dest_path`; return False if the store does not have it."""
+        raise NotImplementedError
+
+    def upload(self, path, key):
+        raise NotImplementedError
+
+
+class LocalAssetStore(AssetStore):
+    """Store on a local or network-mounted directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def download(self, key, dest_path):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False
+        shutil.copyfile(path, dest_path)
+        return True
+
+    def upload(self, path, key):
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_dest = f"{dest}.uploading-{os.getpid()}"
+        shutil.copyfile(path, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+
+class S3AssetStore(AssetStore):
+    """S3-compatible store using concurrent multipart transfers for large assets."""
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region_name=None,
+                 aws_access_key_id=None, aws_secret_access_key=None,
+                 max_concurrency=8, multipart_chunksize=8 * MB):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError as e:
+            raise ImportError("The S3 asset store needs boto3: pip install boto3") from e
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region_name,
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunksize,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+
+    def _key(self, key):
+        return f"{self.prefix.rstrip('/')}/{key}" if self.prefix else key
+
+    def download(self, key, dest_path):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.download_file(self.bucket, self._key(key), dest_path, Config=self.transfer_config)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def upload(self, path, key):
+        self.client.upload_file(path, self.bucket, self._key(key), Config=self.transfer_config)
+
+
+def get_asset_store(config):
+    """
+    Build the shared store from a config mapping (e.g. the [asset_store] secrets section):
+    {"type": "local", "root": ...} or {"type": "s3", "bucket": ..., "endpoint_url": ..., ...}.
+    Returns None when no shared store is configured.
+    """
+    if not config:
+        return None
+    config = dict(config)
+    store_type = config.pop("type", "local")
+    if store_type == "local":
+        return LocalAssetStore(config["root"])
+    if store_type == "s3":
+        return S3AssetStore(**config)
+    raise ValueError(f"Unknown asset store type: {store_type}")
@@ -0,0 +1,190 @@
+"""
+Content-addressed generated assets with single-flight deduplication.
+
+Every generated image, captioned frame and narration clip is stored under a hash
+of what produced it. Identical requests within a render, or from concurrent jobs
+in the same process, share a single upstream call instead of each paying for one.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+from image_backends import FallbackImageBackend
+from media_probe import narration_ext
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class Asset(str):
+    """
+    Path of a generated asset. `produced` is True when this call made it through
+    its provider, rather than reusing it from the local cache, a concurrent caller
+    or the shared store. `draft` is True when a fallback backend stood in for the
+    requested one, so callers can avoid treating it as final output.
+    """
+
+    def __new__(cls, path, produced=False, draft=False):
+        asset = super().__new__(cls, path)
+        asset.produced = produced
+        asset.draft = draft
+        return asset
+
+
+# Shared by every Streamlit session served from this process
+_flight = SingleFlight()
+_store = None
+
+
+def asset_key(*parts):
+    return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:24]
+
+
+def asset_path(directory, key, ext):
+    return os.path.join(directory, f"{key}{ext}")
+
+
+def set_asset_store(store):
+    """Share assets through `store` (see asset_store.py); local directories become its cache."""
+    global _store
+    _store = store
+
+
+def _download(store_key, tmp_path):
+    try:
+        return _store.download(store_key, tmp_path)
+    except Exception as e:
+        # An unreadable store only costs producing the asset locally
+        logging.warning("Failed to download %s from the asset store: %s", store_key, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def get_or_create(path, produce):
+    """
+    Return `path` as an Asset, creating it with `produce(tmp_path)` if it does not exist yet.
+    With a shared store configured, the asset is fetched from the store before
+    producing it, and newly produced assets are uploaded for other nodes.
+    Files are written to a temporary name and renamed, so readers never see partial assets.
+    """
+    if os.path.exists(path):
+        return Asset(path)
+    produced = False
+
+    def build():
+        nonlocal produced
+        if os.path.exists(path):
+            return path
+        store_key = path.replace(os.sep, "/")
+        root, ext = os.path.splitext(path)
+        tmp_path = f"{root}.tmp-{uuid.uuid4().hex}{ext}"
+        try:
+            if _store is not None and _download(store_key, tmp_path):
+                os.replace(tmp_path, path)
+                return path
+            produce(tmp_path)
+            os.replace(tmp_path, path)
+            produced = True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if _store is not None:
+            try:
+                _store.upload(path, store_key)
+            except Exception as e:
+                # The asset is safe locally; other nodes will just produce their own copy
+                logging.warning("Failed to upload %s to the asset store: %s", path, e)
+        return path
+
+    # Only the caller that ran `build` reports the asset as produced
+    _flight.do(path, build)
+    return Asset(path, produced=produced)
+
+
+def image_asset_path(backend, prompt, style, directory="images"):
+    """Where image_asset stores the image for (backend, prompt, style)."""
+    if isinstance(backend, FallbackImageBackend):
+        backend = backend.primary
+    return asset_path(directory, asset_key("image", backend.name, style, prompt), ".jpg")
+
+
+def audio_asset_path(text, voice_id, output_format="mp3_44100_128", directory="audio"):
+    """Where audio_asset stores the narration for (text, voice, format)."""
+    return asset_path(directory, asset_key("audio", voice_id, output_format, text), narration_ext(output_format))
+
+
+def image_asset(backend, prompt, style, postprocess=None, directory="images"):
+    """
+    Generated image for (backend, prompt, style); `postprocess(path)` runs once before it is stored.
+    Returns an Asset, marked as a draft when a fallback backend produced it.
+    """
+    if isinstance(backend, FallbackImageBackend):
+        # Cache under whichever backend actually produced the image, so overflow
+        # drafts never masquerade as the primary backend's output
+        try:
+            return image_asset(backend.primary, prompt, style, postprocess, directory)
+        except backend.fallback_on:
+            return Asset(image_asset(backend.fallback, prompt, style, postprocess, directory), draft=True)
+
+    os.makedirs(directory, exist_ok=True)
+    path = image_asset_path(backend, prompt, style, directory)
+
+    def produce(tmp_path):
+        backend.generate(prompt, style, tmp_path)
+        if postprocess:
+            postprocess(tmp_path)
+
+    asset = get_or_create(path, produce)
+    # Local backends make no provider call worth timing
+    return Asset(asset, produced=asset.produced and backend.remote)
+
+
+def captioned_image_asset(image_path, caption, add_caption, directory="images"):
+    """Captioned copy of `image_path`; `add_caption(image_path, caption, output_path)` draws it."""
+    os.makedirs(directory, exist_ok=True)
+    path = asset_path(directory, asset_key("captioned", image_path, caption), ".jpg")
+    return get_or_create(path, lambda tmp_path: add_caption(image_path, caption, tmp_path))
+
+
+def audio_asset(text, voice_id, synthesize, output_format="mp3_44100_128", directory="audio"):
+    """Narration for (text, voice, format); `synthesize(text, output_path)` calls the TTS provider."""
+    os.makedirs(directory, exist_ok=True)
+    path = audio_asset_path(text, voice_id, output_format, directory)
+    return get_or_create(path, lambda tmp_path: synthesize(text, tmp_path))
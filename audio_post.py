@@ -0,0 +1,180 @@
+"""
+Vectorized narration post-processing.
+
+Segment audio is decoded to NumPy (WAV directly, a batch of MP3s through a
+single ffmpeg call). Each clip then has its leading and trailing silence
+trimmed and its loudness normalized (prepare_clip). StreamingCrossfader joins
+the clips gaplessly as they arrive, which gives the final narration track and
+the exact per-segment durations for the video timeline.
+"""
+import os
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+from moviepy.config import get_setting
+
+SAMPLE_RATE = 44100
+
+AUDIO_POST_DEFAULTS = {
+    # Frames quieter than this, relative to the clip's loudest frame, count as silence
+    "silence_threshold_db": -35.0,
+    "frame_ms": 10,
+    # Silence kept around the speech so words are not clipped
+    "pad_ms": 80,
+    "target_dbfs": -20.0,
+    # Clips whose speech is quieter than this are noise or silence and are left alone
+    "speech_floor_dbfs": -60.0,
+    "max_gain_db": 20.0,
+    "crossfade_ms": 40,
+}
+
+
+def _read_wav(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit WAV narration is supported: {path}")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2").astype(np.float32) / 32768
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples
+
+
+def _decode_compressed(paths):
+    """Decode all non-WAV clips to mono float32 with one ffmpeg process."""
+    if not paths:
+        return []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"]
+        for path in paths:
+            command += ["-i", path]
+        raw_paths = []
+        for idx in range(len(paths)):
+            raw_path = os.path.join(tmp_dir, f"{idx}.raw")
+            raw_paths.append(raw_path)
+            command += ["-map", f"{idx}:a", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", raw_path]
+        subprocess.run(command, check=True, capture_output=True)
+        return [np.fromfile(raw_path, dtype="<i2").astype(np.float32) / 32768 for raw_path in raw_paths]
+
+
+def decode_segments(paths):
+    """Decode every clip to a mono float32 array at SAMPLE_RATE."""
+    decoded = {}
+    compressed = [path for path in paths if not path.endswith(".wav")]
+    for path, samples in zip(compressed, _decode_compressed(compressed)):
+        decoded[path] = samples
+    for path in paths:
+        if path.endswith(".wav"):
+            decoded[path] = _read_wav(path)
+    return [decoded[path] for path in paths]
+
+
+def _frame_levels_db(samples, frame):
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(samples, silence_threshold_db, frame_ms, pad_ms, **_):
+    """Cut leading and trailing frames quieter than the threshold (relative to the loudest frame)."""
+    frame = SAMPLE_RATE * frame_ms // 1000
+    if len(samples) < frame:
+        return samples
+    levels = _frame_levels_db(samples, frame)
+    loud = np.flatnonzero(levels > levels.max() + silence_threshold_db)
+    pad = SAMPLE_RATE * pad_ms // 1000
+    start = max(loud[0] * frame - pad, 0)
+    end = min((loud[-1] + 1) * frame + pad, len(samples))
+    return samples[start:end]
+
+
+def normalize_loudness(samples, target_dbfs, silence_threshold_db, frame_ms, speech_floor_dbfs, max_gain_db, **_):
+    """
+    Scale the clip so its speech RMS hits the target level, without clipping peaks.
+    Gain is capped, and clips with no speech above the floor are not boosted.
+    """
+    frame = SAMPLE_RATE * frame_ms // 1000
+    if len(samples) < frame:
+        return samples
+    levels = _frame_levels_db(samples, frame)
+    speech = levels[levels > levels.max() + silence_threshold_db]
+    # Average power over speech frames only, so pauses do not inflate the gain
+    speech_db = 10 * np.log10(np.mean(10 ** (speech / 10)))
+    if speech_db < speech_floor_dbfs:
+        return samples
+    gain = 10 ** (min(target_dbfs - speech_db, max_gain_db) / 20)
+    peak = np.abs(samples).max()
+    if peak * gain > 0.98:
+        gain = 0.98 / peak
+    return samples * gain
+
+
+class StreamingCrossfader:
+    """
+    Joins clips with linear crossfades as they arrive. Each crossfade depends on
+    both neighbouring clips, so a clip's slice of the final track is released once
+    the next clip has been added (or on finish). Concatenating the released slices
+    gives the narration; their lengths are the segment durations.
+    """
+
+    def __init__(self, crossfade_ms):
+        self.crossfade = SAMPLE_RATE * crossfade_ms // 1000
+        self._pending = None
+        self._carry = np.zeros(0, dtype=np.float32)
+
+    def add(self, clip):
+        """Add the next clip; returns the now final slice for the previous one, or None."""
+        if self._pending is None:
+            self._pending = (clip, 0)
+            return None
+        previous, fade_in = self._pending
+        # Never let a clip's fade-out run into its own fade-in
+        overlap = min(self.crossfade, len(previous) - fade_in, len(clip))
+        released = self._release(previous, fade_in, overlap)
+        self._pending = (clip, overlap)
+        return released
+
+    def finish(self):
+        """Release the last clip's slice."""
+        if self._pending is None:
+            return None
+        clip, fade_in = self._pending
+        self._pending = None
+        return self._release(clip, fade_in, 0)
+
+    def _release(self, clip, fade_in, fade_out):
+        envelope = np.ones(len(clip), dtype=np.float32)
+        if fade_in:
+            envelope[:fade_in] = np.linspace(0, 1, fade_in, endpoint=False)
+        if fade_out:
+            envelope[len(clip) - fade_out:] *= np.linspace(1, 0, fade_out, endpoint=False)
+        shaped = clip * envelope
+        released = shaped[:len(clip) - fade_out].copy()
+        # The previous clip's faded tail plays under this clip's fade-in
+        released[:len(self._carry)] += self._carry
+        self._carry = shaped[len(clip) - fade_out:]
+        return released
+
+
+def write_wav(samples, output_path):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(output_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return output_path
+
+
+def prepare_clip(samples, settings=None):
+    """Trim and normalize one decoded clip."""
+    settings = {**AUDIO_POST_DEFAULTS, **(settings or {})}
+    return normalize_loudness(trim_silence(samples, **settings), **settings)
+
@@ -0,0 +1,126 @@
+"""
+Lazy text extraction for uploaded PDF, Word and text documents.
+
+Text is yielded page by page (or paragraph / chunk by chunk) so callers can stop
+as soon as they have enough, keeping memory and latency bounded on large uploads.
+"""
+import codecs
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Pages read in-process before any pool is started; callers that only need the
+# opening pages (e.g. a summary limited to a few thousand characters) stop here
+SEQUENTIAL_PREFIX_PAGES = 8
+# When at least this many selected pages remain after the prefix, they are extracted in a process pool
+PARALLEL_PAGE_THRESHOLD = 40
+PAGES_PER_TASK = 8
+TEXT_CHUNK_SIZE = 64 * 1024
+
+
+def _extract_pdf_pages(pdf_path, page_numbers):
+    """Worker: extract the text of the given (0-based) pages."""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(pdf_path)
+    return [reader.pages[number].extract_text() or "" for number in page_numbers]
+
+
+def _page_numbers(page_count, page_range):
+    first, last = page_range or (1, page_count)
+    first = max(first, 1)
+    last = min(last, page_count)
+    return list(range(first - 1, last))
+
+
+def _iter_pdf_parallel(file, page_numbers, workers):
+    # Worker processes need a path to reopen the PDF, so spool the upload to disk once
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(file, tmp)
+    batches = [page_numbers[i:i + PAGES_PER_TASK] for i in range(0, len(page_numbers), PAGES_PER_TASK)]
+    workers = workers or os.cpu_count() or 1
+    # Forking the threaded Streamlit server can deadlock workers on locks held at fork time
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+    try:
+        # Keep a bounded window of batches in flight, so stopping early wastes little work
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(_extract_pdf_pages, tmp.name, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Runs when the caller stops early too; drop the pages nobody will read
+        # without waiting for batches that are already running
+        executor.shutdown(wait=False, cancel_futures=True)
+        os.remove(tmp.name)
+
+
+def iter_pdf_pages(file, page_range=None, workers=None):
+    """Yield the text of each selected PDF page in order. `page_range` is 1-based, inclusive."""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(file)
+    page_numbers = _page_numbers(len(reader.pages), page_range)
+    for number in page_numbers[:SEQUENTIAL_PREFIX_PAGES]:
+        yield reader.pages[number].extract_text() or ""
+    rest = page_numbers[SEQUENTIAL_PREFIX_PAGES:]
+    if len(rest) >= PARALLEL_PAGE_THRESHOLD and workers != 1:
+        yield from _iter_pdf_parallel(file, rest, workers)
+        return
+    for number in rest:
+        yield reader.pages[number].extract_text() or ""
+
+
+def iter_docx_paragraphs(file):
+    from docx import Document
+
+    for paragraph in Document(file).paragraphs:
+        yield paragraph.text
+
+
+def iter_text_chunks(file, encoding="utf-8"):
+    file.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = file.read(TEXT_CHUNK_SIZE)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_document_text(file, page_range=None, workers=None):
+    """Yield text pieces from an uploaded document, dispatching on its extension."""
+    if file.name.endswith(".pdf"):
+        return iter_pdf_pages(file, page_range, workers)
+    if file.name.endswith(".docx"):
+        return (f"{text}\n" for text in iter_docx_paragraphs(file))
+    if file.name.endswith(".txt"):
+        return iter_text_chunks(file)
+    raise ValueError("Unsupported file type.")
+
+
+def extract_text(file, page_range=None, max_chars=None, workers=None):
+    """Collect document text, stopping as soon as `max_chars` characters are available."""
+    pieces = []
+    total = 0
+    texts = iter_document_text(file, page_range, workers)
+    try:
+        for text in texts:
+            pieces.append(text)
+            total += len(text)
+            if max_chars is not None and total >= max_chars:
+                break
+    finally:
+        if hasattr(texts, "close"):
+            texts.close()
+    text = "".join(pieces)
+    return text[:max_chars] if max_chars is not None else text
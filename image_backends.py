@@ -0,0 +1,142 @@
+"""
+Pluggable image generation backends shared by the video creator apps.
+"""
+import hashlib
+import os
+import random
+
+import requests
+from openai import RateLimitError
+from PIL import Image, ImageDraw, ImageFilter
+
+# Colour palettes used by the local backend, one per style choice
+STYLE_PALETTES = {
+    "Realistic": [(44, 62, 80), (127, 140, 141), (214, 200, 170), (96, 125, 90)],
+    "Oil Painting": [(92, 51, 23), (181, 101, 29), (230, 190, 120), (60, 80, 110)],
+    "Watercolor": [(173, 216, 230), (255, 218, 224), (204, 229, 204), (250, 240, 200)],
+    "Sketch": [(245, 245, 240), (200, 200, 195), (120, 120, 120), (40, 40, 40)],
+    "Fantasy Art": [(58, 12, 163), (114, 9, 183), (247, 37, 133), (76, 201, 240)],
+    "3D Render": [(20, 33, 61), (252, 163, 17), (229, 229, 229), (0, 150, 199)],
+}
+DEFAULT_PALETTE = STYLE_PALETTES["Realistic"]
+
+
+class ImageBackend:
+    """Base class: turn a prompt into an image file on disk."""
+
+    name = "base"
+    # Whether generating calls an external service (as opposed to drawing locally)
+    remote = True
+
+    def generate(self, prompt, style, output_path):
+        raise NotImplementedError
+
+
+class DalleImageBackend(ImageBackend):
+    """Generate images with the OpenAI images API."""
+
+    name = "dalle"
+
+    def __init__(self, client, model="dall-e-3", size="1024x1024", quality="standard"):
+        self.client = client
+        self.model = model
+        self.size = size
+        self.quality = quality
+        self.name = f"dalle:{model}:{size}:{quality}"
+
+    def generate(self, prompt, style, output_path):
+        kwargs = {"model": self.model, "prompt": prompt, "size": self.size, "n": 1}
+        if self.model == "dall-e-3":
+            kwargs["quality"] = self.quality
+        response = self.client.images.generate(**kwargs)
+        image_url = response.data[0].url
+        image_data = requests.get(image_url).content
+        with open(output_path, "wb") as f:
+            f.write(image_data)
+        return output_path
+
+
+class ProceduralImageBackend(ImageBackend):
+    """
+    Cheap local backend: a gradient in the style's palette with a few soft shapes,
+    blended over the placeholder image. Deterministic per prompt and costs nothing.
+    """
+
+    name = "procedural"
+    remote = False
+
+    def __init__(self, placeholder_path=None, size=(1024, 1024)):
+        self.placeholder_path = placeholder_path
+        self.size = size
+        self.name = f"procedural:{size[0]}x{size[1]}"
+
+    def generate(self, prompt, style, output_path):
+        seed = int(hashlib.sha256(f"{style}|{prompt}".encode("utf-8")).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        palette = STYLE_PALETTES.get(style, DEFAULT_PALETTE)
+        width, height = self.size
+
+        # Vertical gradient between two palette colours
+        top, bottom = rng.sample(palette, 2)
+        gradient = Image.new("RGB", (1, 256))
+        for y in range(256):
+            t = y / 255
+            gradient.putpixel((0, y), tuple(int(a + (b - a) * t) for a, b in zip(top, bottom)))
+        img = gradient.resize((width, height))
+
+        # A handful of soft blobs so consecutive frames are distinguishable
+        shapes = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        shapes_draw = ImageDraw.Draw(shapes)
+        for _ in range(rng.randint(3, 6)):
+            radius = rng.randint(width // 10, width // 3)
+            cx, cy = rng.randint(0, width), rng.randint(0, height)
+            shapes_draw.ellipse(
+                [(cx - radius, cy - radius), (cx + radius, cy + radius)],
+                fill=rng.choice(palette) + (110,)
+            )
+        shapes = shapes.filter(ImageFilter.GaussianBlur(radius=width // 20))
+        img = Image.alpha_composite(img.convert("RGBA"), shapes).convert("RGB")
+
+        if self.placeholder_path and os.path.exists(self.placeholder_path):
+            with Image.open(self.placeholder_path) as placeholder:
+                template = placeholder.convert("RGB").resize((width, height))
+            img = Image.blend(img, template, alpha=0.2)
+
+        img.save(output_path, "JPEG")
+        return output_path
+
+
+class FallbackImageBackend(ImageBackend):
+    """Use the primary backend, switching to the fallback when the primary is rate-limited."""
+
+    def __init__(self, primary, fallback, fallback_on=(RateLimitError,)):
+        self.primary = primary
+        self.fallback = fallback
+        self.fallback_on = fallback_on
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def generate(self, prompt, style, output_path):
+        try:
+            return self.primary.generate(prompt, style, output_path)
+        except self.fallback_on:
+            return self.fallback.generate(prompt, style, output_path)
+
+
+# Backend choices offered in the UI
+IMAGE_BACKEND_CHOICES = ["DALL·E 3", "Local draft (free)"]
+
+
+def get_image_backend(choice, client, placeholder_path=None, preview=False):
+    """
+    Build the image backend for a UI choice. Preview backends produce smaller,
+    cheaper images (dall-e-2 at 512x512) meant to be replaced on promotion.
+    """
+    if preview:
+        local = ProceduralImageBackend(placeholder_path, size=(512, 512))
+        dalle = DalleImageBackend(client, model="dall-e-2", size="512x512")
+    else:
+        local = ProceduralImageBackend(placeholder_path)
+        dalle = DalleImageBackend(client)
+    if choice == "Local draft (free)":
+        return local
+    return FallbackImageBackend(dalle, local)
@@ -0,0 +1,95 @@
+"""
+Write-ahead journal for resumable renders.
+
+Each job appends one JSON line per completed (or failed) stage of each segment and
+fsyncs it before moving on. Resubmitting the same job replays the journal, so only
+segments whose stages are missing or failed are fetched and encoded again.
+"""
+import json
+import os
+import threading
+import time
+
+from assets import asset_key
+
+
+def render_job_id(*inputs):
+    """Stable id for a render job, derived from everything that affects its output."""
+    return asset_key("job", *inputs)
+
+
+class RenderJournal:
+    def __init__(self, job_id, jobs_dir="jobs", timings=None):
+        self.job_id = job_id
+        self.timings = timings
+        self.job_dir = os.path.join(jobs_dir, job_id)
+        self.path = os.path.join(self.job_dir, "journal.jsonl")
+        self._entries = {}
+        # Segments may be encoded on a background thread while later ones are generated
+        self._lock = threading.Lock()
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._replay()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; that stage simply reruns
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        stages = self._entries.setdefault(entry["segment"], {})
+        if entry["stage"] == "failed":
+            stages.pop(entry["failed_stage"], None)
+            stages["failed"] = entry
+        else:
+            stages[entry["stage"]] = entry
+            stages.pop("failed", None)
+
+    def record(self, segment, stage, **data):
+        entry = {"segment": segment, "stage": stage, **data}
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(entry)
+        return entry
+
+    def get(self, segment, stage):
+        with self._lock:
+            return self._entries.get(segment, {}).get(stage)
+
+    def run_stage(self, segment, stage, produce, key=None):
+        """
+        Return the path recorded for this stage if it is still on disk (and was produced
+        from the same `key`, when given); otherwise run `produce()`, which returns a path,
+        and record it. Draft assets (a fallback standing in for the requested backend) are
+        returned but not recorded, so the next attempt tries the stage again.
+        Failures are journaled and re-raised.
+        """
+        entry = self.get(segment, stage)
+        if entry and entry.get("key") == key and os.path.exists(entry["path"]):
+            return entry["path"]
+        started = time.monotonic()
+        try:
+            path = produce()
+        except Exception as e:
+            self.record(segment, "failed", failed_stage=stage, error=str(e))
+            raise
+        seconds = time.monotonic() - started
+        if getattr(path, "draft", False):
+            return path
+        self.record(segment, stage, path=path, key=key, seconds=round(seconds, 3))
+        # Cache and store hits return instantly and would drag the provider timings toward zero
+        if self.timings is not None and getattr(path, "produced", False):
+            self.timings.observe(stage, seconds)
+        return path
+
+    def job_path(self, name):
+        return os.path.join(self.job_dir, name)
@@ -0,0 +1,153 @@
+"""
+Pure-Python duration probing for narration clips.
+
+Planning the timeline only needs each clip's duration, which can be read from
+MP3 frame headers or a WAV header without spawning an ffmpeg reader per clip.
+"""
+import os
+import wave
+
+# Bitrates in kbps, indexed by the header's 4-bit bitrate index
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_BITRATES[(2, 3)] = _BITRATES[(2, 2)]
+
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    25: [11025, 12000, 8000],
+}
+
+# ElevenLabs PCM output is 16-bit little-endian mono
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+
+
+def id3v2_size(data):
+    """Length of a leading ID3v2 tag, or 0 if there is none."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_frame_header(data, offset):
+    """Return (frame_length, samples_per_frame, sample_rate, version, channel_mode) or None."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    version = {3: 1, 2: 2, 0: 25}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+    return length, samples, sample_rate, version, b3 >> 6
+
+
+def _vbr_frame_count(data, offset, version, channel_mode):
+    """Frame count from a Xing/Info or VBRI header in the first frame, if present."""
+    mono = channel_mode == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12 and data[xing + 7] & 0x01:
+        return int.from_bytes(data[xing + 8:xing + 12], "big")
+    vbri = offset + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        return int.from_bytes(data[vbri + 14:vbri + 18], "big")
+    return None
+
+
+def mp3_duration(path):
+    """Duration in seconds of an MP3 file, from its frame headers."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = id3v2_size(data)
+    # Skip any junk before the first frame
+    while offset < len(data) - 4 and _parse_frame_header(data, offset) is None:
+        offset += 1
+    first = _parse_frame_header(data, offset)
+    if first is None:
+        raise ValueError(f"No MPEG audio frames found in {path}")
+
+    length, samples, sample_rate, version, channel_mode = first
+    frame_count = _vbr_frame_count(data, offset, version, channel_mode)
+    if frame_count is not None:
+        return frame_count * samples / sample_rate
+
+    total_samples = 0
+    while True:
+        header = _parse_frame_header(data, offset)
+        if header is None:
+            break
+        length, samples, sample_rate = header[:3]
+        total_samples += samples
+        offset += length
+    return total_samples / sample_rate
+
+
+def wav_duration(path):
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def probe_duration(path):
+    """Duration in seconds of an MP3 or WAV file without decoding it."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".mp3":
+        return mp3_duration(path)
+    if ext == ".wav":
+        return wav_duration(path)
+    raise ValueError(f"Unsupported audio format: {ext}")
+
+
+def write_pcm_as_wav(chunks, output_path, sample_rate):
+    """Wrap raw PCM chunks (as returned by ElevenLabs pcm_* formats) in a WAV header."""
+    with wave.open(output_path, "wb") as wav:
+        wav.setnchannels(PCM_CHANNELS)
+        wav.setsampwidth(PCM_SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        for chunk in chunks:
+            wav.writeframes(chunk)
+    return output_path
+
+
+def narration_ext(output_format):
+    """File extension for an ElevenLabs output format such as mp3_44100_128 or pcm_22050."""
+    return ".wav" if output_format.startswith("pcm_") else ".mp3"
+
+
+def save_narration(chunks, output_path, output_format):
+    """Write streamed TTS audio to disk, adding a WAV header for raw PCM formats."""
+    if output_format.startswith("pcm_"):
+        return write_pcm_as_wav(chunks, output_path, int(output_format.split("_")[1]))
+    with open(output_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return output_path
@@ -0,0 +1,156 @@
+"""
+Render cost/latency planning and process-wide admission control.
+
+Before a render starts, estimate_render predicts its segment count, API calls,
+spend and wall-clock time from the script and from historical per-stage timings.
+The AdmissionController then queues renders when the CPU budget is used up and
+downscales image generation (one image shared by several consecutive segments)
+when the image provider's quota would be exceeded.
+"""
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+from image_backends import DalleImageBackend, FallbackImageBackend
+
+# List prices in USD; adjust if the provider pricing changes
+IMAGE_PRICES = {
+    ("dall-e-3", "1024x1024"): 0.04,
+    ("dall-e-2", "512x512"): 0.018,
+}
+TTS_PRICE_PER_1K_CHARS = 0.30
+PLAN_CALL_PRICE = 0.01
+WORDS_PER_SECOND = 2.5
+
+# Seconds per call, used until real timings have been observed. Only calls that
+# actually reach a provider are timed, so local image backends use a fixed cost.
+DEFAULT_STAGE_SECONDS = {"image": 12.0, "captioned": 0.3, "audio": 3.0, "encoded": 2.0}
+LOCAL_IMAGE_SECONDS = 0.5
+
+
+class StageTimings:
+    """Exponential moving averages of per-stage durations, persisted between runs."""
+
+    def __init__(self, path="stage_timings.json", alpha=0.2):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._seconds = dict(DEFAULT_STAGE_SECONDS)
+        if os.path.exists(path):
+            with open(path) as f:
+                self._seconds.update(json.load(f))
+
+    def mean(self, stage):
+        return self._seconds.get(stage, 0.0)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self._seconds.get(stage, seconds)
+            self._seconds[stage] = previous + self.alpha * (seconds - previous)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._seconds, f)
+            os.replace(tmp_path, self.path)
+
+
+def image_price(image_backend):
+    """Price per generated image for a backend (0 for local backends)."""
+    if isinstance(image_backend, FallbackImageBackend):
+        image_backend = image_backend.primary
+    if isinstance(image_backend, DalleImageBackend):
+        return IMAGE_PRICES.get((image_backend.model, image_backend.size), IMAGE_PRICES[("dall-e-3", "1024x1024")])
+    return 0.0
+
+
+def estimate_render(texts, image_backend, timings, image_stride=1, cached_images=0, cached_texts=()):
+    """
+    Predict the work, spend and wall-clock time of rendering one segment per text.
+    `cached_images` images and the narration of `cached_texts` already exist, so they cost nothing.
+    """
+    segments = len(texts)
+    images = max(math.ceil(segments / image_stride) - cached_images, 0)
+    price = image_price(image_backend)
+    image_calls = images if price else 0
+    to_narrate = [text for text in texts if text not in cached_texts]
+    tts_chars = sum(len(text) for text in to_narrate)
+    words = sum(len(text.split()) for text in texts)
+
+    spend = image_calls * price + tts_chars / 1000 * TTS_PRICE_PER_1K_CHARS + PLAN_CALL_PRICE
+    wall_clock = (
+        images * (timings.mean("image") if price else LOCAL_IMAGE_SECONDS)
+        + len(to_narrate) * timings.mean("audio")
+        + segments * (timings.mean("captioned") + timings.mean("encoded"))
+    )
+    return {
+        "segments": segments,
+        "image_calls": image_calls,
+        "tts_calls": len(to_narrate),
+        "tts_chars": tts_chars,
+        "narration_seconds": words / WORDS_PER_SECOND,
+        "spend": spend,
+        "wall_clock_seconds": wall_clock,
+        "image_stride": image_stride,
+    }
+
+
+def describe_estimate(estimate):
+    return (
+        f"{estimate['segments']} segments, {estimate['image_calls']} image calls, "
+        f"{estimate['tts_chars']} TTS characters, about ${estimate['spend']:.2f} "
+        f"and {estimate['wall_clock_seconds'] / 60:.1f} min to render "
+        f"(~{estimate['narration_seconds']:.0f}s of narration)"
+    )
+
+
+class AdmissionController:
+    """
+    Shared by all sessions in the process. At most `max_concurrent_renders` run at
+    once (the CPU budget); further renders wait. Admitted renders get an image
+    stride so the combined image call rate stays under `image_calls_per_minute`.
+    """
+
+    def __init__(self, image_calls_per_minute=50, max_concurrent_renders=None, max_image_stride=4):
+        self.image_calls_per_minute = image_calls_per_minute
+        self.max_concurrent_renders = max_concurrent_renders or max(1, (os.cpu_count() or 2) // 2)
+        self.max_image_stride = max_image_stride
+        self._cond = threading.Condition()
+        self._active = {}
+
+    @staticmethod
+    def _image_rate(estimate):
+        """Image calls per minute the render will issue over its expected duration."""
+        minutes = max(estimate["wall_clock_seconds"] / 60, 1)
+        return estimate["image_calls"] / minutes
+
+    def _choose_stride(self, texts, image_backend, timings, cached):
+        in_use = sum(self._image_rate(estimate) for estimate in self._active.values())
+        for stride in range(1, self.max_image_stride + 1):
+            estimate = estimate_render(texts, image_backend, timings, image_stride=stride, **cached)
+            if in_use + self._image_rate(estimate) <= self.image_calls_per_minute:
+                break
+        return estimate
+
+    @contextmanager
+    def admit(self, texts, image_backend, timings, on_queued=None, **cached):
+        """
+        Wait for a render slot and yield the (possibly downscaled) estimate to render with.
+        `cached` (cached_images, cached_texts) is passed on to estimate_render.
+        """
+        token = object()
+        with self._cond:
+            notified = False
+            while len(self._active) >= self.max_concurrent_renders:
+                if on_queued and not notified:
+                    on_queued(len(self._active))
+                    notified = True
+                self._cond.wait(timeout=5)
+            estimate = self._choose_stride(texts, image_backend, timings, cached)
+            self._active[token] = estimate
+        try:
+            yield estimate
+        finally:
+            with self._cond:
+                del self._active[token]
+                self._cond.notify_all()
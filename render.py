@@ -0,0 +1,301 @@
+"""
+Render profiles and manifests shared by the video creator apps.
+
+A manifest records everything needed to render a video (captioned image and
+narration per segment), so a fast preview can later be promoted to a full
+quality render without regenerating the audio.
+
+Segments are encoded as soon as their assets exist and published to an HLS
+playlist, so playback can start after the first segment; the final MP4 is
+joined from the same segments once the last one is done.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from moviepy.config import get_setting
+
+from assets import asset_key, asset_path, get_or_create
+from audio_post import (
+    AUDIO_POST_DEFAULTS, SAMPLE_RATE, StreamingCrossfader, decode_segments, prepare_clip, write_wav,
+)
+from media_probe import probe_duration
+
+RENDER_PROFILES = {
+    "preview": {"resolution": 360, "fps": 8, "preset": "ultrafast"},
+    "full": {"resolution": 1024, "fps": 24, "preset": "medium"},
+}
+
+
+def save_manifest(manifest, path):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def load_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def encode_segment(image_path, audio_path, profile_name, output_path):
+    """Encode one still image plus its narration into a standalone MP4 segment."""
+    profile = RENDER_PROFILES[profile_name]
+    size = profile["resolution"]
+    command = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-loop", "1", "-framerate", str(profile["fps"]), "-i", image_path,
+        "-i", audio_path,
+        "-t", f"{probe_duration(audio_path):.3f}",
+        "-vf", f"scale={size}:{size},format=yuv420p",
+        "-c:v", "libx264", "-preset", profile["preset"], "-tune", "stillimage", "-r", str(profile["fps"]),
+        # Fixed audio parameters so segments can be joined without re-encoding
+        "-c:a", "aac", "-ar", "44100", "-ac", "2", "-b:a", "128k",
+        "-f", "mp4", output_path,
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+    return output_path
+
+
+def segment_asset(segment, profile_name, directory="segments"):
+    """Encoded segment for (captioned image, narration, profile), shared across jobs."""
+    os.makedirs(directory, exist_ok=True)
+    path = asset_path(
+        directory, asset_key("segment", segment["captioned_image"], segment["audio"], profile_name), ".mp4"
+    )
+    return get_or_create(
+        path, lambda tmp_path: encode_segment(segment["captioned_image"], segment["audio"], profile_name, tmp_path)
+    )
+
+
+def hls_segment_asset(segment_path):
+    """MPEG-TS copy of an encoded MP4 segment for the HLS playlist (stream copy, no re-encode)."""
+    path = f"{os.path.splitext(segment_path)[0]}.ts"
+    command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", segment_path, "-c", "copy", "-f", "mpegts"]
+    return get_or_create(path, lambda tmp_path: subprocess.run(command + [tmp_path], check=True, capture_output=True))
+
+
+def decoded_narration_asset(audio_path, directory="audio"):
+    """
+    PCM WAV copy of a compressed narration clip, decoded once and cached like any
+    other asset. Progressive renders receive clips one at a time, so each new MP3
+    clip costs one ffmpeg decode the first time it is used and none afterwards.
+    """
+    if audio_path.endswith(".wav"):
+        return audio_path
+    os.makedirs(directory, exist_ok=True)
+    return get_or_create(
+        asset_path(directory, asset_key("decoded", audio_path), ".wav"),
+        lambda tmp_path: write_wav(decode_segments([audio_path])[0], tmp_path)
+    )
+
+
+def narration_slice_asset(samples, key, directory="audio"):
+    """Processed narration for one segment, written once as WAV."""
+    os.makedirs(directory, exist_ok=True)
+    return get_or_create(asset_path(directory, key, ".wav"), lambda tmp_path: write_wav(samples, tmp_path))
+
+
+def write_atomically(output_path, write):
+    """
+    Run `write(tmp_path)` and rename the result over `output_path`, so anyone still
+    streaming an earlier version of the file never reads a partial one.
+    """
+    root, ext = os.path.splitext(output_path)
+    tmp_path = f"{root}.tmp-{uuid.uuid4().hex}{ext}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def concat_segments(segment_paths, output_path):
+    """Join encoded segments with ffmpeg's concat demuxer, copying streams without re-encoding."""
+
+    def concat(tmp_path):
+        list_path = f"{tmp_path}.txt"
+        with open(list_path, "w") as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        command = [
+            get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", "-movflags", "+faststart", tmp_path,
+        ]
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+        finally:
+            os.remove(list_path)
+
+    return write_atomically(output_path, concat)
+
+
+class HlsPlaylist:
+    """
+    HLS EVENT playlist that grows as segments are encoded. Segments are linked into
+    the playlist directory, which is served as a whole (see artifact_server.py).
+    Every render gets its own directory under `root`, so concurrent renders of the
+    same job never touch each other's playlist.
+    """
+
+    def __init__(self, root, target_duration=10):
+        self.directory = os.path.join(root, uuid.uuid4().hex[:12])
+        self.target_duration = target_duration
+        self.entries = []
+        self.ended = False
+        os.makedirs(self.directory)
+        self._write()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "index.m3u8")
+
+    def append(self, segment_path, duration):
+        name = f"segment_{len(self.entries):05d}.ts"
+        dest = os.path.join(self.directory, name)
+        try:
+            os.link(segment_path, dest)
+        except OSError:
+            shutil.copyfile(segment_path, dest)
+        self.entries.append((name, duration))
+        self._write()
+
+    def end(self):
+        self.ended = True
+        self._write()
+
+    def _write(self):
+        target = max([self.target_duration] + [math.ceil(duration) for _, duration in self.entries])
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target}", "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for idx, (name, duration) in enumerate(self.entries):
+            if idx:
+                # Every segment is encoded standalone, with timestamps starting from zero
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [f"#EXTINF:{duration:.3f},", name]
+        if self.ended:
+            lines.append("#EXT-X-ENDLIST")
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+class ProgressiveRender:
+    """
+    Encodes segments while later ones are still being generated. Each clip is
+    trimmed, normalized and crossfaded as it arrives; a segment is encoded on a
+    background thread once the next clip fixes its crossfade, then appended to
+    the HLS playlist. finish() joins everything into the final video.
+    """
+
+    def __init__(self, profile_name, hls_root, audio_settings=None, journal=None):
+        self.profile_name = profile_name
+        self.journal = journal
+        self.settings = {**AUDIO_POST_DEFAULTS, **(audio_settings or {})}
+        self.playlist = HlsPlaylist(hls_root)
+        self._crossfader = StreamingCrossfader(self.settings["crossfade_ms"])
+        # One worker keeps segments in playlist order
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._failed = threading.Event()
+        self._pending = None
+        self._slices = []
+        self._futures = []
+
+    def add(self, segment, samples=None):
+        """Add the next segment; `samples` is its decoded narration, if already at hand."""
+        if samples is None:
+            samples = decode_segments([decoded_narration_asset(segment["audio"])])[0]
+        released = self._crossfader.add(prepare_clip(samples, self.settings))
+        if released is not None:
+            self._submit(self._pending, released)
+        self._pending = segment
+
+    def _submit(self, segment, samples):
+        self._slices.append(samples)
+        self._futures.append(self._executor.submit(self._encode, segment, samples))
+
+    def _encode(self, segment, samples):
+        if self._failed.is_set():
+            # Do not publish segments past a gap in the playlist
+            return None
+        try:
+            slice_key = asset_key("narration", hashlib.sha256(samples.tobytes()).hexdigest())
+            timed_segment = {**segment, "audio": narration_slice_asset(samples, slice_key)}
+            if self.journal is None:
+                path = segment_asset(timed_segment, self.profile_name)
+            else:
+                path = self.journal.run_stage(
+                    segment["index"], "encoded", lambda: segment_asset(timed_segment, self.profile_name),
+                    key=[timed_segment["captioned_image"], timed_segment["audio"], self.profile_name]
+                )
+            self.playlist.append(hls_segment_asset(path), len(samples) / SAMPLE_RATE)
+            return path
+        except Exception:
+            self._failed.set()
+            raise
+
+    def finish(self, output_path, narration_path=None):
+        """Encode the last segment, end the playlist and write the final video and narration."""
+        if self._pending is None:
+            self.cancel()
+            raise ValueError("No segments to render.")
+        self._submit(self._pending, self._crossfader.finish())
+        self._pending = None
+        try:
+            segment_paths = [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown()
+            self.playlist.end()
+
+        narration_path = narration_path or f"{os.path.splitext(output_path)[0]}_narration.wav"
+        narration = np.concatenate(self._slices)
+        write_atomically(narration_path, lambda tmp_path: write_wav(narration, tmp_path))
+        concat_segments(segment_paths, output_path)
+        return output_path, narration_path
+
+
+    def cancel(self):
+        """
+        Abandon the render: segments not encoded yet are dropped and the playlist is
+        ended, so players stop waiting for more.
+        """
+        self._failed.set()
+        # Waits for at most the one segment already being encoded
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.playlist.end()
+
+
+def render_manifest(manifest, profile_name, output_path, narration_path=None, journal=None, hls_root=None):
+    """
+    Render all manifest segments to a single video using the given profile.
+
+    The narration is post-processed (silence trimmed, loudness normalized,
+    crossfaded) and each segment is encoded with its slice of the final track,
+    so the timeline matches the narration exactly. Segments are joined by
+    stream copy. With a journal, segments already encoded by an earlier
+    (interrupted) attempt are reused.
+    Returns (video_path, narration_path).
+    """
+    segments = manifest["segments"]
+    if not segments:
+        raise ValueError("Manifest has no segments to render.")
+
+    if hls_root is None:
+        hls_root = journal.job_path("hls") if journal else f"{os.path.splitext(output_path)[0]}_hls"
+    renderer = ProgressiveRender(profile_name, hls_root, manifest.get("audio_settings"), journal)
+    for segment, samples in zip(segments, decode_segments([segment["audio"] for segment in segments])):
+        renderer.add(segment, samples)
+    return renderer.finish(output_path, narration_path)
@@ -0,0 +1,93 @@
+"""
+Turn a narration script into segments and image prompts with one batched LLM call.
+
+The plan (segmentation, one image prompt per segment, and a shared character and
+setting description) is cached next to the script, so re-rendering the same
+script never pays for the call twice.
+"""
+import hashlib
+import json
+import os
+
+PLAN_PROMPT = """You are planning the visuals for a narrated short video in {style} style.
+Split the script below into narration segments of one sentence each, keeping the
+original wording. For every segment write an image prompt that keeps the same
+characters and setting across the whole video.
+
+Respond with JSON only, in this shape:
+{{
+  "characters": "consistent description of the main characters",
+  "setting": "consistent description of the setting",
+  "segments": [{{"text": "narration sentence", "image_prompt": "what to draw"}}]
+}}
+
+Script:
+{script}"""
+
+
+def _plan_key(script, style):
+    return hashlib.sha256(f"{style}|{script}".encode("utf-8")).hexdigest()[:16]
+
+
+def fallback_plan(script):
+    """Plan without the LLM: one segment per sentence, the sentence as its own prompt."""
+    sentences = [sentence for sentence in script.split(". ") if sentence.strip()]
+    return {
+        "characters": "",
+        "setting": "",
+        "segments": [{"text": sentence, "image_prompt": sentence} for sentence in sentences],
+    }
+
+
+def _validate_plan(plan):
+    segments = plan.get("segments")
+    if not isinstance(segments, list) or not segments:
+        raise ValueError("Plan has no segments.")
+    for segment in segments:
+        if not segment.get("text") or not segment.get("image_prompt"):
+            raise ValueError(f"Malformed plan segment: {segment}")
+    plan.setdefault("characters", "")
+    plan.setdefault("setting", "")
+    return plan
+
+
+def cached_plan(script, style, cache_dir="scripts"):
+    """The plan for (script, style) if it was generated before, else None."""
+    plan_path = os.path.join(cache_dir, f"plan_{_plan_key(script, style)}.json")
+    if not os.path.exists(plan_path):
+        return None
+    with open(plan_path) as f:
+        return json.load(f)
+
+
+def plan_script(client, script, style, cache_dir="scripts"):
+    """Return the cached plan for (script, style), generating it with gpt-4o if needed."""
+    plan = cached_plan(script, style, cache_dir)
+    if plan is not None:
+        return plan
+    os.makedirs(cache_dir, exist_ok=True)
+    key = _plan_key(script, style)
+    plan_path = os.path.join(cache_dir, f"plan_{key}.json")
+
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        response_format={"type": "json_object"},
+        messages=[{"role": "user", "content": PLAN_PROMPT.format(style=style.lower(), script=script)}]
+    )
+    plan = _validate_plan(json.loads(response.choices[0].message.content))
+
+    with open(os.path.join(cache_dir, f"script_{key}.txt"), "w") as f:
+        f.write(script)
+    with open(plan_path, "w") as f:
+        json.dump(plan, f, indent=2)
+    return plan
+
+
+def build_image_prompt(plan, segment, style):
+    """Full image prompt for a segment, carrying the shared character and setting."""
+    parts = [segment["image_prompt"]]
+    if plan.get("characters"):
+        parts.append(f"Characters: {plan['characters']}")
+    if plan.get("setting"):
+        parts.append(f"Setting: {plan['setting']}")
+    return ". ".join(parts) + f". In {style.lower()} style"
@@ -1,10 +1,22 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from openai import OpenAI
 from elevenlabs import ElevenLabs
-from moviepy.editor import concatenate_videoclips, ImageClip, AudioFileClip, CompositeVideoClip
 from PIL import Image, ImageDraw, ImageFont
 import requests
 import os
+from image_backends import IMAGE_BACKEND_CHOICES, get_image_backend
+from script_planner import build_image_prompt, cached_plan, fallback_plan, plan_script
+from asset_store import get_asset_store
+from audio_post import AUDIO_POST_DEFAULTS
+from assets import (
+    audio_asset, audio_asset_path, captioned_image_asset, image_asset, image_asset_path, set_asset_store,
+)
+from artifact_server import artifact_serving_enabled, artifact_url, player_url
+from journal import RenderJournal, render_job_id
+from media_probe import save_narration
+from planner import AdmissionController, StageTimings, describe_estimate, estimate_render
+from render import ProgressiveRender, load_manifest, save_manifest
 
 # Hide specific Streamlit elements
 hide_toolbar_css = """
@@ -22,6 +34,25 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 # Initialize ElevenLabs client
 elevenlabs_client = ElevenLabs(api_key=st.secrets["elevenlabs_api_key"])
 
+# Optional shared asset store, so generated assets are reused across app instances
+@st.cache_resource
+def load_asset_store():
+    return get_asset_store(st.secrets.get("asset_store"))
+
+set_asset_store(load_asset_store())
+
+# Per-stage timings and render admission are shared by every session in the process
+@st.cache_resource
+def load_stage_timings():
+    return StageTimings()
+
+@st.cache_resource
+def load_admission_controller():
+    return AdmissionController(**st.secrets.get("admission", {}))
+
+stage_timings = load_stage_timings()
+admission = load_admission_controller()
+
 # Compress images before adding to video
 def compress_image(image_path, output_path, quality=50):
     with Image.open(image_path) as img:
@@ -37,28 +68,32 @@ def add_text_overlay(image_path, text, output_path, font_path):
         img = Image.open(image_path).convert("RGBA")
         draw = ImageDraw.Draw(img)
 
+        # Layout is designed for 1024px frames; scale it so 512px preview drafts caption the same way
+        scale = img.width / 1024
+        pad = round(20 * scale)
+
         # Load font
-        font = ImageFont.truetype(font_path, size=30)
+        font = ImageFont.truetype(font_path, size=round(30 * scale))
 
         # Calculate maximum text width (pixels) for wrapping
-        max_text_width = img.width - 40  # Padding of 20px on each side
+        max_text_width = img.width - 2 * pad  # Padding on each side
         wrapped_text = textwrap.fill(text, width=40)  # Approx. 40 chars per line
 
         # Calculate text size and position
         text_bbox = draw.textbbox((0, 0), wrapped_text, font=font)
         text_width = text_bbox[2] - text_bbox[0]
         text_height = text_bbox[3] - text_bbox[1]
-        total_text_height = text_height + 20  # Add padding
+        total_text_height = text_height + pad  # Add padding
 
         # Position the text at the bottom of the image
-        x_start = 20  # 20px padding from left
-        y_start = img.height - total_text_height - 20  # 20px padding from bottom
+        x_start = pad  # Padding from left
+        y_start = img.height - total_text_height - pad  # Padding from bottom
 
         # Create semi-transparent rectangle for text background
         background = Image.new("RGBA", img.size, (255, 255, 255, 0))
         background_draw = ImageDraw.Draw(background)
         background_draw.rectangle(
-            [(x_start - 10, y_start - 10), (x_start + text_width + 10, y_start + total_text_height + 10)],
+            [(x_start - pad // 2, y_start - pad // 2), (x_start + text_width + pad // 2, y_start + total_text_height + pad // 2)],
             fill=(0, 0, 0, 128)
         )
 
@@ -78,6 +113,70 @@ def add_text_overlay(image_path, text, output_path, font_path):
         st.error(f"Failed to add text overlay: {e}")
         raise e
 
+def generate_captioned_image(image_backend, image_prompt, style, sentence, journal, idx):
+    """
+    Generate, compress and caption the image for one sentence, journaling each stage.
+    Returns (captioned_path, draft); draft is True when a local draft stood in for the image service.
+    """
+    image_filename = journal.run_stage(idx, "image", lambda: image_asset(
+        image_backend, image_prompt, style,
+        postprocess=lambda path: compress_image(path, path, quality=50)
+    ), key=image_prompt)
+    captioned_path = journal.run_stage(idx, "captioned", lambda: captioned_image_asset(
+        image_filename, sentence,
+        lambda image_path, text, output_path: add_text_overlay(image_path, text, output_path, local_font_path)
+    ), key=[image_filename, sentence])
+    return captioned_path, getattr(image_filename, "draft", False)
+
+def synthesize_speech(text, output_path):
+    """Narrate one sentence with ElevenLabs."""
+    audio = elevenlabs_client.text_to_speech.convert(
+        voice_id=VOICE_ID,
+        model_id="eleven_multilingual_v2",
+        text=text,
+        voice_settings={"stability": 0.2, "similarity_boost": 0.8},
+        output_format=NARRATION_FORMAT
+    )
+    save_narration(audio, output_path, NARRATION_FORMAT)
+
+def cached_work(plan, image_backend, style):
+    """Images and narration from earlier renders that this plan will reuse, for the estimate."""
+    texts = [segment["text"] for segment in plan["segments"]]
+    prompts = [build_image_prompt(plan, segment, style) for segment in plan["segments"]]
+    return {
+        "cached_images": sum(os.path.exists(image_asset_path(image_backend, prompt, style)) for prompt in prompts),
+        "cached_texts": {text for text in texts if os.path.exists(audio_asset_path(text, VOICE_ID, NARRATION_FORMAT))},
+    }
+
+def promotion_work(manifest, image_backend):
+    """Promotion reuses all narration and only regenerates draft images."""
+    return {
+        "cached_images": sum(
+            not segment.get("draft_image")
+            or os.path.exists(image_asset_path(image_backend, segment["image_prompt"], manifest["style"]))
+            for segment in manifest["segments"]
+        ),
+        "cached_texts": {segment["text"] for segment in manifest["segments"]},
+    }
+
+def start_progressive_render(profile_name, audio_settings, journal):
+    """Encode segments as they are generated, with a player that starts on the first finished clip."""
+    renderer = ProgressiveRender(profile_name, journal.job_path("hls"), audio_settings, journal)
+    if not artifact_serving_enabled():
+        return renderer
+    st.caption("Playback starts as soon as the first clips are encoded; the rest are appended as they finish.")
+    try:
+        components.iframe(player_url(renderer.playlist.directory), height=520)
+    except Exception as e:
+        # The render itself does not depend on the player
+        st.warning(f"Live playback is unavailable: {e}")
+    return renderer
+
+def publish_video(video_path):
+    """Keep the finished video in the session, with an artifact URL when the artifact server is reachable."""
+    st.session_state.video_path = video_path
+    st.session_state.video_url = artifact_url(video_path) if artifact_serving_enabled() else None
+
 # Download font file
 def download_font(font_url, local_path):
     if not os.path.exists(local_path):
@@ -96,6 +195,12 @@ font_url = "https://github.com/scooter7/vidshorts/blob/main/Arial.ttf"
 local_font_path = "Arial.ttf"
 download_font(font_url, local_font_path)
 
+# Narration voice and render outputs (written inside each job's directory, so sessions never share them)
+VOICE_ID = "pqHfZKP75CvOlQylNhV4"
+# Set elevenlabs_output_format to a pcm_* format (e.g. pcm_22050) where the plan supports it
+NARRATION_FORMAT = st.secrets.get("elevenlabs_output_format", "mp3_44100_128")
+FINAL_VIDEO_NAME = "final_video.mp4"
+
 # App title and description
 st.title("Storytelling Video Creator with Styles")
 st.write("Generate videos with captions and select your desired image style.")
@@ -120,6 +225,7 @@ style_choice = st.selectbox(
     "Choose an image style for the video:",
     ["Realistic", "Oil Painting", "Watercolor", "Sketch", "Fantasy Art", "3D Render"]
 )
+backend_choice = st.selectbox("Image generator:", IMAGE_BACKEND_CHOICES)
 
 if topic and duration_choice and style_choice and st.button("Generate Script"):
     st.write("Generating story script...")
@@ -141,78 +247,179 @@ if "script" in st.session_state and st.session_state.script:
     st.write("Generated Script:")
     story_script = st.text_area("Story Script", st.session_state.script, height=200, key="story_script")
 
+    preview_mode = st.checkbox("Preview mode (low resolution, fast render)", value=False)
+    crossfade_ms = st.slider("Crossfade between sentences (ms):", 0, 300, AUDIO_POST_DEFAULTS["crossfade_ms"], step=10)
+
+    # Predict the work before committing to it; assets reused from earlier renders are free
+    estimate_backend = get_image_backend(backend_choice, client, placeholder_path, preview=preview_mode)
+    estimate_plan = cached_plan(story_script, style_choice) or fallback_plan(story_script)
+    estimate = estimate_render(
+        [segment["text"] for segment in estimate_plan["segments"]], estimate_backend, stage_timings,
+        **cached_work(estimate_plan, estimate_backend, style_choice)
+    )
+    st.caption(f"Estimate: {describe_estimate(estimate)}")
+
     if st.button("Generate Video"):
         st.write("Processing...")
 
-        sentences = story_script.split(". ")
-        video_clips = []
-        os.makedirs("images", exist_ok=True)
-        os.makedirs("audio", exist_ok=True)
+        st.write("Planning scenes and image prompts...")
+        try:
+            plan = plan_script(client, story_script, style_choice)
+        except Exception as e:
+            st.warning(f"Scene planning failed, using one image per sentence. Error: {e}")
+            plan = fallback_plan(story_script)
+        segments = []
+        missing = []
+        image_backend = get_image_backend(backend_choice, client, placeholder_path, preview=preview_mode)
+
+        # Wait for a render slot; when the image quota is saturated the render is downscaled
+        texts = [plan_segment["text"] for plan_segment in plan["segments"]]
+        with admission.admit(
+            texts, image_backend, stage_timings, **cached_work(plan, image_backend, style_choice),
+            on_queued=lambda active: st.info(f"Waiting for one of {active} running renders to finish...")
+        ) as estimate:
+            image_stride = estimate["image_stride"]
+            if image_stride > 1:
+                st.info(f"The image provider is busy, so each image is shared by {image_stride} sentences.")
 
-        for idx, sentence in enumerate(sentences):
-            st.write(f"Generating image for sentence {idx + 1}...")
-            image_prompt = f"{sentence} in {style_choice.lower()} style"
+            # Resubmitting the same job resumes from its journal, redoing only missing or failed stages
+            journal = RenderJournal(render_job_id(
+                story_script, style_choice, backend_choice, preview_mode, VOICE_ID, NARRATION_FORMAT
+            ), timings=stage_timings)
+            profile_name = "preview" if preview_mode else "full"
+            renderer = start_progressive_render(profile_name, {"crossfade_ms": crossfade_ms}, journal)
 
-            try:
-                response = client.images.generate(
-                    model="dall-e-3",
-                    prompt=image_prompt,
-                    size="1024x1024",
-                    quality="standard",
-                    n=1
-                )
-                image_url = response.data[0].url
-                image_filename = f"images/image_{idx}.jpg"
-                image_data = requests.get(image_url).content
-                with open(image_filename, "wb") as f:
-                    f.write(image_data)
-                compress_image(image_filename, image_filename, quality=50)
-                captioned_image_path = f"images/captioned_image_{idx}.jpg"
-                add_text_overlay(image_filename, sentence, captioned_image_path, local_font_path)
-            except Exception as e:
-                st.warning(f"Image generation failed for sentence {idx + 1}. Error: {e}")
-                if placeholder_path:
-                    captioned_image_path = placeholder_path
-                else:
-                    st.error("No placeholder available. Skipping this frame.")
+            for idx, plan_segment in enumerate(plan["segments"]):
+                sentence = plan_segment["text"]
+                st.write(f"Generating image for sentence {idx + 1}...")
+                # With an image stride, consecutive sentences share the group leader's image
+                image_prompt = build_image_prompt(plan, plan["segments"][idx - idx % image_stride], style_choice)
+
+                try:
+                    captioned_image_path, draft = generate_captioned_image(
+                        image_backend, image_prompt, style_choice, sentence, journal, idx
+                    )
+                    if draft:
+                        st.warning(
+                            f"The image service was busy, so sentence {idx + 1} uses a local draft image. "
+                            "Render Full Quality to replace it."
+                        )
+                except Exception as e:
+                    st.warning(f"Image generation failed for sentence {idx + 1}. Error: {e}")
+                    if placeholder_path:
+                        captioned_image_path, draft = placeholder_path, True
+                    else:
+                        st.error("No placeholder available. Skipping this frame.")
+                        missing.append(idx)
+                        continue
+
+                st.write(f"Generating audio for sentence {idx + 1}...")
+                try:
+                    audio_filename = journal.run_stage(
+                        idx, "audio", lambda: audio_asset(sentence, VOICE_ID, synthesize_speech, NARRATION_FORMAT),
+                        key=sentence
+                    )
+                except Exception as e:
+                    st.error(f"Audio generation failed for sentence {idx + 1}. Error: {e}")
+                    missing.append(idx)
                     continue
 
-            st.write(f"Generating audio for sentence {idx + 1}...")
-            try:
-                audio = elevenlabs_client.text_to_speech.convert(
-                    voice_id="pqHfZKP75CvOlQylNhV4",
-                    model_id="eleven_multilingual_v2",
-                    text=sentence,
-                    voice_settings={"stability": 0.2, "similarity_boost": 0.8}
+                segments.append({
+                    "index": idx,
+                    "text": sentence,
+                    "image_prompt": image_prompt,
+                    "captioned_image": captioned_image_path,
+                    "audio": audio_filename,
+                    "draft_image": preview_mode or draft,
+                })
+                if not missing:
+                    try:
+                        # Encoded in the background while the next sentence is generated
+                        renderer.add(segments[-1])
+                    except Exception as e:
+                        st.error(f"Failed to prepare the narration for sentence {idx + 1}. Error: {e}")
+                        missing.append(idx)
+
+            if missing:
+                renderer.cancel()
+                st.error(
+                    f"Sentences {', '.join(str(idx + 1) for idx in missing)} could not be generated. "
+                    "Click Generate Video again to retry just those; completed work is kept."
                 )
-                audio_filename = f"audio/audio_{idx}.mp3"
-                with open(audio_filename, "wb") as f:
-                    for chunk in audio:
-                        f.write(chunk)
-            except Exception as e:
-                st.error(f"Audio generation failed for sentence {idx + 1}. Error: {e}")
-                continue
+            elif segments:
+                manifest = {
+                    "job_id": journal.job_id,
+                    "style": style_choice,
+                    "backend": backend_choice,
+                    "audio_settings": {"crossfade_ms": crossfade_ms},
+                    "segments": segments,
+                }
+                st.session_state.manifest_path = save_manifest(manifest, journal.job_path("manifest.json"))
+                st.session_state.manifest_profile = profile_name
+                st.session_state.has_draft_images = any(segment["draft_image"] for segment in segments)
+                st.write("Combining all video clips...")
+                try:
+                    video_path, _ = renderer.finish(journal.job_path(FINAL_VIDEO_NAME))
+                    publish_video(video_path)
+                    st.write("Video generation complete!")
+                except Exception as e:
+                    st.error(f"Failed to create the final video: {e}")
+            else:
+                renderer.cancel()
+                st.error("No video clips were created. Check for errors in the input or generation process.")
 
-            st.write(f"Combining image and audio for sentence {idx + 1}...")
+    # Promote an approved preview (or a render with draft frames) to full quality, reusing its narration
+    if st.session_state.get("has_draft_images") and st.button("Render Full Quality"):
+        manifest = load_manifest(st.session_state.manifest_path)
+        image_backend = get_image_backend(manifest["backend"], client, placeholder_path)
+        journal = RenderJournal(f"{manifest['job_id']}-full", timings=stage_timings)
+        with admission.admit(
+            [segment["text"] for segment in manifest["segments"]], image_backend, stage_timings,
+            **promotion_work(manifest, image_backend),
+            on_queued=lambda active: st.info(f"Waiting for one of {active} running renders to finish...")
+        ):
+            renderer = start_progressive_render("full", manifest.get("audio_settings"), journal)
             try:
-                audio_clip = AudioFileClip(audio_filename)
-                image_clip = ImageClip(captioned_image_path, duration=audio_clip.duration).set_audio(audio_clip)
-                video_clips.append(image_clip.set_fps(30))
+                for segment in manifest["segments"]:
+                    if not segment.get("draft_image"):
+                        renderer.add(segment)
+                        continue
+                    idx = segment["index"]
+                    st.write(f"Generating full quality image for sentence {idx + 1}...")
+                    try:
+                        segment["captioned_image"], segment["draft_image"] = generate_captioned_image(
+                            image_backend, segment["image_prompt"], manifest["style"], segment["text"], journal, idx
+                        )
+                        if segment["draft_image"]:
+                            st.warning(f"The image service was busy, so sentence {idx + 1} still uses a draft image.")
+                    except Exception as e:
+                        st.warning(f"Image generation failed for sentence {idx + 1}, keeping the preview image. Error: {e}")
+                    renderer.add(segment)
             except Exception as e:
-                st.error(f"Failed to combine image and audio: {e}")
-                continue
+                renderer.cancel()
+                st.error(f"Failed to prepare the narration for sentence {segment['index'] + 1}. Error: {e}")
+            else:
+                st.session_state.manifest_path = save_manifest(manifest, journal.job_path("manifest.json"))
+                st.write("Combining all video clips...")
+                try:
+                    video_path, _ = renderer.finish(journal.job_path(FINAL_VIDEO_NAME))
+                    st.session_state.manifest_profile = "full"
+                    st.session_state.has_draft_images = any(segment["draft_image"] for segment in manifest["segments"])
+                    publish_video(video_path)
+                    st.write("Video generation complete!")
+                except Exception as e:
+                    st.error(f"Failed to create the final video: {e}")
 
-        if video_clips:
-            st.write("Combining all video clips...")
-            try:
-                final_video = concatenate_videoclips(video_clips, method="compose")
-                final_video_path = "final_video.mp4"
-                final_video.write_videofile(final_video_path, codec="libx264", audio_codec="aac", fps=24)
-                st.write("Video generation complete!")
-                with open(final_video_path, "rb") as video_file:
-                    video_bytes = video_file.read()
-                    st.download_button("Download Video", video_bytes, file_name="final_video.mp4", mime="video/mp4")
-            except Exception as e:
-                st.error(f"Failed to create the final video: {e}")
+    if st.session_state.get("video_path"):
+        if st.session_state.get("manifest_profile") == "preview":
+            st.info("This is a low resolution preview. Render full quality once you are happy with it.")
+        elif st.session_state.get("has_draft_images"):
+            st.info("Some sentences use draft images because the image service was busy. Render full quality to replace them.")
+        if st.session_state.video_url:
+            # Streamed from disk by the artifact server; only its URL lives in the session
+            st.video(st.session_state.video_url)
+            st.link_button("Download Video", f"{st.session_state.video_url}?download=1")
         else:
-            st.error("No video clips were created. Check for errors in the input or generation process.")
+            st.video(st.session_state.video_path)
+            with open(st.session_state.video_path, "rb") as video_file:
+                st.download_button("Download Video", video_file, file_name=FINAL_VIDEO_NAME, mime="video/mp4")